@@ -0,0 +1,15 @@
+#!/bin/sh
+# Run melpazoid.el against the package mounted (read-only) at /workspace/src.
+# Byte-compiling writes .elc files, so work on a copy; the report is also
+# saved to /workspace/results if that's mounted.  Exits with Emacs's status.
+set -e
+cp -r "$WORKSPACE/src/." "$ELISP_PATH"
+cp "$WORKSPACE/melpazoid.el" "$ELISP_PATH"
+cd "$ELISP_PATH"
+if [ -w "$WORKSPACE/results" ]; then
+    status=0
+    /usr/bin/emacs --script melpazoid.el > "$WORKSPACE/results/report.txt" || status=$?
+    cat "$WORKSPACE/results/report.txt"
+    exit $status
+fi
+exec /usr/bin/emacs --script melpazoid.el
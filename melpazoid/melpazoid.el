@@ -23,6 +23,24 @@
 (defvar melpazoid--misc-header-printed-p nil "Whether misc-header was printed.")
 (defvar melpazoid-can-modify-buffers t "Whether melpazoid can modify buffers.")
 (defvar melpazoid-error-p nil)
+(defvar melpazoid-check-performance-p
+  (not (member (getenv "MELPAZOID_PERFORMANCE") '(nil "")))
+  "Whether to run the (opt-in) performance checks.")
+(defvar melpazoid--package-dirs nil
+  "Directories of all the packages being checked, when there are several.")
+(defconst melpazoid--package-initialize-form
+  '(let ((deps-dir (getenv "MELPAZOID_DEPS_DIR")))
+     (require 'package)
+     (when (and deps-dir (file-directory-p deps-dir))
+       (add-to-list 'package-directory-list deps-dir))
+     (package-initialize)
+     ;; the archives were refreshed when the dependencies were installed,
+     ;; so they're newer than the ones in the image (which are weekly):
+     (when (and deps-dir (file-directory-p (expand-file-name "archives" deps-dir)))
+       (let ((package-user-dir deps-dir))
+         (package-read-all-archive-contents))))
+  "Form that initializes packages, including those in MELPAZOID_DEPS_DIR.
+The archive contents are read from MELPAZOID_DEPS_DIR too, if it has them.")
 
 (defun melpazoid-byte-compile (filename)
   "Wrapper for running `byte-compile-file' against FILENAME."
@@ -201,21 +219,77 @@ a Docker container, e.g. kellyk/emacs does not include the .el files."
   (melpazoid-misc "(when (null " "Consider `unless ...` instead of `when (null ...)`")
   (melpazoid-misc "http://" "Prefer `https` over `http` if possible ([why?](https://news.ycombinator.com/item?id=22933774))" nil t)
   (melpazoid-misc "(eq [^()]*\\<nil\\>.*)" "You can use `not` or `null`")
-  ;; (melpazoid-misc "line-number-at-pos" "line-number-at-pos is surprisingly slow - avoid it")
   )
 
-(defun melpazoid-misc (regexp msg &optional no-smart-space include-comments)
+(defconst melpazoid--loop-regexp
+  (regexp-opt '("cl-dolist" "cl-dotimes" "cl-loop" "cl-mapcar" "dolist" "dotimes"
+                "mapc" "mapcan" "mapcar" "mapconcat" "maphash" "seq-do" "seq-doseq"
+                "seq-map" "while")
+              'symbols)
+  "Regexp matching the names of looping forms.")
+
+(defconst melpazoid--heavy-libraries
+  '("ert" "eww" "gnus" "magit" "org" "org-agenda" "shr" "tramp" "url")
+  "Libraries that are slow to load, and shouldn't be required eagerly.")
+
+(defun melpazoid-check-performance ()
+  "Opt-in checks for common performance mistakes in hot paths."
+  (melpazoid-misc "(line-number-at-pos" "`line-number-at-pos` is surprisingly slow - avoid it in hot paths")
+  (melpazoid-misc "(buffer-substring " "Prefer `buffer-substring-no-properties` unless you need the text properties")
+  (melpazoid-misc "(length " "`length` is O(n); consider computing it once outside this loop" nil nil #'melpazoid--in-loop-p)
+  (melpazoid-misc "(append " "`append` in a loop copies the list each time; consider `push` and then `nreverse`" nil nil #'melpazoid--in-loop-p)
+  (melpazoid-misc "(nconc " "`nconc` in a loop walks the list each time; consider `push` and then `nreverse`" nil nil #'melpazoid--in-loop-p)
+  (melpazoid-misc "(\\(regexp-opt\\|rx-to-string\\) " "Build this regexp once outside the loop (or cache it)" nil nil #'melpazoid--in-loop-p)
+  (melpazoid-misc (concat "^(require '" (regexp-opt melpazoid--heavy-libraries 'symbols))
+                  "This library is slow to load; can an `autoload`, `declare-function` or `with-eval-after-load` do instead?")
+  (let ((functions (melpazoid--hook-and-timer-functions)))
+    (when functions
+      (melpazoid-misc
+       "(goto-char (point-min))\\|(buffer-string)\\|(buffer-substring\\(-no-properties\\)? (point-min) (point-max))"
+       "This function runs on `post-command-hook` or a timer; avoid buffer-wide scans here"
+       nil nil (lambda () (member (melpazoid--defun-name) functions))))))
+
+(defun melpazoid--in-loop-p ()
+  "Return non-nil if point is inside a looping form."
+  (let ((loop-p nil))
+    (save-excursion
+      (dolist (open-paren (nth 9 (syntax-ppss)) loop-p)
+        (goto-char (1+ open-paren))
+        (when (looking-at melpazoid--loop-regexp)
+          (setq loop-p t))))))
+
+(defun melpazoid--hook-and-timer-functions ()
+  "Return the names of functions added to command hooks or run by timers."
+  (let ((functions nil)
+        (regexp (concat "(\\(?:add-hook[[:space:]]+'\\(?:pre\\|post\\)-command-hook"
+                        "\\|run-at-time\\|run-with-idle-timer\\|run-with-timer\\)"
+                        "[^#')]*#?'\\([^[:space:]()]+\\)")))
+    (save-excursion
+      (goto-char (point-min))
+      (while (re-search-forward regexp nil t)
+        (push (match-string-no-properties 1) functions)))
+    functions))
+
+(defun melpazoid--defun-name ()
+  "Return the name of the top-level definition around point, if any."
+  (when (ignore-errors (beginning-of-defun) t)
+    (and (looking-at "(\\(?:cl-\\)?defun\\*?[[:space:]]+\\([^[:space:]()]+\\)")
+         (match-string-no-properties 1))))
+
+(defun melpazoid-misc (regexp msg &optional no-smart-space include-comments predicate)
   "If a search for REGEXP passes, report MSG as a misc check.
 If NO-SMART-SPACE is nil, use smart spaces -- i.e. replace all
 SPC characters in REGEXP with [[:space:]]+.  If INCLUDE-COMMENTS
-then also scan comments for REGEXP."
+then also scan comments for REGEXP.  If PREDICATE is non-nil, only
+report matches where calling it (at the match) returns non-nil."
   (unless no-smart-space
     (setq regexp (replace-regexp-in-string " " "[[:space:]]+" regexp)))
   (save-excursion
     (goto-char (point-min))
     (while (re-search-forward regexp nil t)
-      (when (or include-comments
-                (not (comment-only-p (point-at-bol) (point-at-eol))))
+      (when (and (or include-comments
+                     (not (comment-only-p (point-at-bol) (point-at-eol))))
+                 (or (not predicate) (save-excursion (funcall predicate))))
         ;; print a header unless it's already been printed:
         (unless melpazoid--misc-header-printed-p
           (melpazoid-insert "Suggestions/experimental static checks:")
@@ -259,7 +333,8 @@ OBJECTS are objects to interpolate into the string using `format'."
       ;; (melpazoid--check-declare)
       (melpazoid-package-lint)
       (melpazoid-check-sharp-quotes)
-      (melpazoid-check-misc))
+      (melpazoid-check-misc)
+      (when melpazoid-check-performance-p (melpazoid-check-performance)))
     (pop-to-buffer melpazoid-buffer)
     (goto-char (point-min))))
 
@@ -267,40 +342,209 @@ OBJECTS are objects to interpolate into the string using `format'."
   "Reset melpazoid's current state variables."
   (add-to-list 'package-archives '("melpa" . "http://melpa.org/packages/"))
   (add-to-list 'package-archives '("org" . "http://orgmode.org/elpa/"))
-  (package-initialize)
+  (eval melpazoid--package-initialize-form t)
   (setq melpazoid--misc-header-printed-p nil)
   (setq melpazoid-error-p nil)
   (ignore-errors (kill-buffer melpazoid-buffer)))
 
-(when noninteractive
-  ;; Check every elisp file in `default-directory' (except melpazoid.el)
-  (add-to-list 'load-path ".")
-  (let ((filename nil) (filenames (directory-files ".")))
-    (while filenames
-      (setq filename (car filenames) filenames (cdr filenames))
+(defun melpazoid--elisp-files ()
+  "Return the elisp files in `default-directory' to check (except melpazoid.el)."
+  (let ((filenames nil))
+    (dolist (filename (directory-files ".") (nreverse filenames))
       (and (not (string= (file-name-base filename) "melpazoid"))
            (not (string-match ".*-pkg.el$" filename))
            (not (string-match ".el~$" filename))  ; file-name-extension misses these
            (string= (file-name-extension filename) "el")
-           (melpazoid filename))))
+           (push filename filenames)))))
+
+(defun melpazoid--files-to-check (filenames)
+  "Return those FILENAMES listed in env var MELPAZOID_FILES, or all of them.
+FILENAMES that require a listed file, directly or not, are returned too,
+since a change to a file can break the files that require it."
+  (let ((only (split-string (or (getenv "MELPAZOID_FILES") "")))
+        (added t)
+        (to-check nil))
+    (while (and only added)
+      (setq added nil)
+      (dolist (filename filenames)
+        (unless (member filename only)
+          (dolist (required (melpazoid--required-files filename filenames))
+            (when (and (member required only) (not (member filename only)))
+              (push filename only)
+              (setq added t))))))
+    (dolist (filename filenames (nreverse to-check))
+      (when (or (null only) (member filename only))
+        (push filename to-check)))))
+
+(defun melpazoid--load-order (filenames)
+  "Sort FILENAMES so each file comes after the files in FILENAMES it requires."
+  (let ((order nil))
+    (dolist (filename filenames)
+      (setq order (melpazoid--load-order-visit filename filenames order nil)))
+    (nreverse order)))
+
+(defun melpazoid--load-order-visit (filename filenames order visiting)
+  "Push FILENAME onto ORDER after the FILENAMES it requires.
+VISITING lists the files on the current path, to break require cycles."
+  (unless (or (member filename order) (member filename visiting))
+    (dolist (required (melpazoid--required-files filename filenames))
+      (setq order (melpazoid--load-order-visit
+                   required filenames order (cons filename visiting))))
+    (push filename order))
+  order)
+
+(defun melpazoid--required-files (filename filenames)
+  "Return those FILENAMES that FILENAME requires."
+  (let ((required nil))
+    (with-temp-buffer
+      (insert-file-contents filename)
+      (while (re-search-forward "(require[[:space:]]+'\\([^[:space:])]+\\)" nil t)
+        (let ((required-file (concat (match-string 1) ".el")))
+          (when (and (member required-file filenames)
+                     (not (member required-file required)))
+            (push required-file required)))))
+    (nreverse required)))
+
+(defun melpazoid--eval-in-fresh-emacs (form)
+  "Evaluate FORM in a fresh batch Emacs and return the object it reports.
+FORM reports its result by printing it after a \"melpazoid-profile:\" marker,
+so that anything else the package prints is ignored."
+  (with-temp-buffer
+    (call-process (expand-file-name invocation-name invocation-directory)
+                  nil (list t nil) nil
+                  "--batch" "--eval" (prin1-to-string form))
+    (goto-char (point-min))
+    (when (search-forward "melpazoid-profile:" nil t)
+      (ignore-errors (read (current-buffer))))))
+
+(defun melpazoid--profile-require (filename)
+  "Load FILENAME (preferring its .elc) in a fresh Emacs.
+Return a plist with the load's :error status, its :time in seconds and
+the new :features it loaded, or nil if the child Emacs itself failed."
+  (melpazoid--eval-in-fresh-emacs
+   `(progn
+      (dolist (dir ',(cons default-directory melpazoid--package-dirs))
+        (add-to-list 'load-path dir))
+      ,melpazoid--package-initialize-form
+      (let ((features-before features)
+            (start (float-time))
+            (error-p nil))
+        (condition-case nil
+            (load ,(expand-file-name (file-name-sans-extension filename)) nil t)
+          (error (setq error-p t)))
+        (let ((elapsed (- (float-time) start))
+              (new-features nil))
+          (dolist (feature features)
+            (unless (memq feature features-before) (push feature new-features)))
+          (princ "\nmelpazoid-profile:")
+          (prin1 (list :error error-p :time elapsed :features new-features)))))))
+
+(defun melpazoid--profile-forms (filename)
+  "Evaluate FILENAME's top-level forms one by one in a fresh Emacs.
+Return a list of (SECONDS LINE) for each form, slowest first."
+  (let ((timings
+         (melpazoid--eval-in-fresh-emacs
+          `(progn
+             (dolist (dir ',(cons default-directory melpazoid--package-dirs))
+               (add-to-list 'load-path dir))
+             ,melpazoid--package-initialize-form
+             (let ((forms nil) (timings nil) (lexical nil))
+               (with-temp-buffer
+                 (insert-file-contents ,(expand-file-name filename))
+                 (goto-char (point-min))
+                 (setq lexical (re-search-forward
+                                "lexical-binding:[[:blank:]]*t" (point-at-eol) t))
+                 (ignore-errors
+                   (while (progn (forward-comment (buffer-size)) (not (eobp)))
+                     (push (cons (line-number-at-pos) (read (current-buffer))) forms))))
+               (let ((load-file-name ,(expand-file-name filename))
+                     (load-in-progress t))
+                 (ignore-errors
+                   (dolist (form (nreverse forms))
+                     (let ((start (float-time)))
+                       (eval (cdr form) (and lexical t))
+                       (push (list (- (float-time) start) (car form)) timings)))))
+               (princ "\nmelpazoid-profile:")
+               (prin1 timings))))))
+    (sort timings (lambda (a b) (> (car a) (car b))))))
+
+(defun melpazoid--autoload-count (filename)
+  "Return the number of autoload cookies in FILENAME."
+  (with-temp-buffer
+    (insert-file-contents filename)
+    (how-many "^;;;###autoload")))
+
+(defun melpazoid--ms (seconds)
+  "Format SECONDS as milliseconds."
+  (format "%.1fms" (* 1000 seconds)))
+
+(defun melpazoid-profile-load (filename filenames)
+  "Report on loading FILENAME in a fresh Emacs.
+FILENAMES are the package's other files, which aren't counted as
+libraries that FILENAME loads eagerly."
+  (melpazoid-insert "Loading %s" filename)
+  (let ((result (melpazoid--profile-require filename)))
+    (if (or (null result) (plist-get result :error))
+        (melpazoid-insert "%s:Error: Emacs %s errored during load"
+                          filename emacs-version)
+      (let* ((timings (melpazoid--profile-forms filename))
+             (elc-size (nth 7 (file-attributes (concat filename "c"))))
+             (libraries nil))
+        (dolist (feature (plist-get result :features))
+          (unless (member (format "%s.el" feature) filenames)
+            (push (symbol-name feature) libraries)))
+        (setq libraries (nreverse libraries))
+        (melpazoid-insert "- require: %s; top-level forms: %s; autoloads: %s; .elc: %s"
+                          (melpazoid--ms (plist-get result :time))
+                          (melpazoid--ms (apply #'+ (mapcar #'car timings)))
+                          (melpazoid--autoload-count filename)
+                          (if elc-size (format "%.1fKB" (/ elc-size 1024.0)) "n/a"))
+        (dolist (timing (melpazoid--take 3 timings))
+          (melpazoid-insert "- slow form: %s#L%s (%s)"
+                            filename (cadr timing) (melpazoid--ms (car timing))))
+        (when libraries
+          (melpazoid-insert "- eagerly loads %s libraries: %s%s"
+                            (length libraries)
+                            (mapconcat #'identity (melpazoid--take 10 libraries) ", ")
+                            (if (> (length libraries) 10) ", ..." "")))))))
+
+(defun melpazoid--take (n list)
+  "Return the first N elements of LIST."
+  (butlast list (max 0 (- (length list) n))))
+
+(defun melpazoid--check-directory (directory)
+  "Check every elisp file in DIRECTORY (except melpazoid.el)."
+  (let ((default-directory directory))
+    (dolist (filename (melpazoid--files-to-check (melpazoid--elisp-files)))
+      (let ((default-directory directory))  ; `melpazoid' switches buffers
+        (melpazoid filename))))
 
   ;; check whether FILENAMEs can be simply loaded (TODO: offer backtrace)
-  (melpazoid-insert "\n### Loadability ###\n")
-  (melpazoid-insert "Verifying ability to #'load each file:")
-  (melpazoid-insert "```")
-  (let ((filename nil) (filenames (directory-files ".")))
-    (while filenames
-      (setq filename (car filenames) filenames (cdr filenames))
-      (when (and (not (string= (file-name-base filename) "melpazoid"))
-                 (not (string-match ".*-pkg.el" filename))
-                 (not (string-match ".el~$" filename))  ; file-name-extension misses these
-                 (string= (file-name-extension filename) "el"))
-        (melpazoid-insert "Loading %s" filename)
-        (unless (ignore-errors (load (expand-file-name filename) nil t t))
-          (melpazoid-insert "%s:Error: Emacs %s errored during load"
-                            filename emacs-version)))))
-  (melpazoid-insert "Done.")
-  (melpazoid-insert "```"))
+  (let ((default-directory directory))
+    (melpazoid-insert "\n### Loadability ###\n")
+    (melpazoid-insert "Loading each file in dependency order, each in a fresh Emacs:")
+    (melpazoid-insert "```")
+    (let ((filenames (melpazoid--elisp-files)))
+      (dolist (filename (melpazoid--files-to-check (melpazoid--load-order filenames)))
+        (melpazoid-profile-load filename filenames)))
+    (melpazoid-insert "Done.")
+    (melpazoid-insert "```")))
+
+(when noninteractive
+  (add-to-list 'load-path ".")
+  ;; MELPAZOID_PACKAGES lists several packages to check, as DIRECTORY/MAIN-FILE
+  (let ((packages (split-string (or (getenv "MELPAZOID_PACKAGES") ""))))
+    (if (null packages)
+        (melpazoid--check-directory default-directory)
+      (setq melpazoid--package-dirs
+            (mapcar (lambda (package) (expand-file-name (file-name-directory package)))
+                    packages))
+      (dolist (dir melpazoid--package-dirs)
+        (add-to-list 'load-path dir))
+      (dolist (package packages)
+        (melpazoid-insert "## %s ##" (directory-file-name (file-name-directory package)))
+        (setenv "PACKAGE_MAIN" (file-name-nondirectory package))
+        (melpazoid--check-directory (expand-file-name (file-name-directory package)))))))
 
 (provide 'melpazoid)
 ;;; melpazoid.el ends here
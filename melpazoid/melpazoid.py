@@ -1,34 +1,53 @@
 # -*- coding: utf-8 -*-
 """
-usage: melpazoid.py [-h] [--license] [--recipe RECIPE] [target]
+usage: melpazoid.py [-h] [--license] [--lint-recipes DIRECTORY]
+                    [--performance] [--recipe RECIPE] [--watch DIRECTORY]
+                    [target]
 
 positional arguments:
-  target           a MELPA PR URL, or a local path to a recipe or package
+  target             a MELPA PR URL, or a local path to a recipe or package
 
 optional arguments:
-  -h, --help       show this help message and exit
-  --license        only check licenses
-  --recipe RECIPE  a valid MELPA recipe
+  -h, --help         show this help message and exit
+  --license          only check licenses
+  --lint-recipes DIRECTORY
+                     lint every recipe in a directory (e.g. MELPA's recipes/)
+  --performance      also run the (opt-in) performance checks
+  --recipe RECIPE    a valid MELPA recipe (can be given more than once)
+  --watch DIRECTORY  re-check a local package whenever its files change
 """
 import argparse
+import concurrent.futures
 import configparser
+import contextlib
+import fnmatch
 import functools
 import glob
-import io  # noqa: F401 -- used by doctests
+import hashlib
+import http.server
+import io
+import json
 import operator
 import os
 import re
 import requests
+import resource
 import shutil
+import signal
 import subprocess
 import sys
 import tempfile
+import threading
 import time
-from typing import Iterator, List, TextIO, Tuple
+import urllib.parse
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO, Tuple
 
 _RETURN_CODE = 0  # eventual return code when run as script
 _MELPAZOID_ROOT = os.path.join(os.path.dirname(__file__), '..')
 _PKG_SUBDIR = os.path.join(_MELPAZOID_ROOT, 'pkg')
+_CACHE_DIR = os.path.expanduser(
+    os.environ.get('MELPAZOID_CACHE_DIR', '~/.cache/melpazoid')
+)
 
 # define the colors of the report (or none), per https://no-color.org
 # https://misc.flogisoft.com/bash/tip_colors_and_formatting
@@ -58,13 +77,418 @@ VALID_LICENSES_GITHUB = {
 }
 
 
+# What --lint-recipes accepts in a recipe
+RECIPE_KEYWORDS = {
+    ':branch',
+    ':commit',
+    ':fetcher',
+    ':files',
+    ':make-targets',
+    ':old-names',
+    ':org-exports',
+    ':repo',
+    ':shell-command',
+    ':url',
+    ':version-regexp',
+}
+REPO_FETCHERS = {  # these use :repo
+    'bitbucket',
+    'codeberg',
+    'github',
+    'gitlab',
+    'sourcehut',
+}
+URL_FETCHERS = {'git', 'hg'}  # these use :url
+
+# The checks run in stages, cheapest first; after any "gated" stage that finds
+# a problem the remaining stages are skipped.  Both can be set with env vars,
+# e.g. MELPAZOID_STAGES=preflight,packaging MELPAZOID_GATED_STAGES=preflight
+STAGES = ['preflight', 'build', 'packaging']
+GATED_STAGES = ['preflight']
+# Each stage (and cloning) has a deadline in seconds, which can be set with
+# env vars, e.g. MELPAZOID_TIMEOUT_BUILD=600; a stage that runs out of time
+# is stopped and reported as a failure
+STAGE_TIMEOUTS = {'clone': 600, 'preflight': 300, 'build': 1800, 'packaging': 300}
+REQUEST_TIMEOUT = 60  # seconds to wait on any single network request
+DEPS_MAX_AGE = 14 * 24 * 60 * 60  # seconds to keep an old dependency install
+_DEADLINE: Optional[float] = None  # when the current stage runs out of time
+_BYTES_FETCHED = 0  # bytes downloaded so far, by requests and clones
+_USAGE_LOCK = threading.RLock()  # guards _BYTES_FETCHED and _METRICS
+_USAGE: Dict[str, Dict[str, float]] = {}  # resource usage of each stage
+
+# Metrics are exported in Prometheus' text format to MELPAZOID_METRICS_FILE
+# and/or on http://localhost:$MELPAZOID_METRICS_PORT/metrics (listening on
+# MELPAZOID_METRICS_ADDRESS, 127.0.0.1 by default), and events are logged as
+# JSON lines to MELPAZOID_LOG_FILE ('-' for stderr)
+METRICS = {
+    'melpazoid_reviews_total': ('counter', 'Reviews completed, by result.'),
+    'melpazoid_review_seconds': ('histogram', 'Wall time of each review.'),
+    'melpazoid_stage_seconds': ('histogram', 'Wall time of each stage.'),
+    'melpazoid_stage_timeouts_total': ('counter', 'Stages stopped at a deadline.'),
+    'melpazoid_cache_requests_total': ('counter', 'Cache lookups, by result.'),
+    'melpazoid_http_requests_total': ('counter', 'HTTP requests, by host.'),
+    'melpazoid_background_fetched_bytes_total': (
+        'counter',
+        'Bytes fetched by lookups in background threads, outside any stage.',
+    ),
+    'melpazoid_github_ratelimit_remaining': (
+        'gauge',
+        'GitHub API requests left in the current rate limit window.',
+    ),
+    'melpazoid_container_failures_total': ('counter', 'Failed containers.'),
+}
+HISTOGRAM_BUCKETS = [1, 5, 15, 30, 60, 120, 300, 600, 1800]  # seconds
+_METRICS: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+
+
 def _run_checks(recipe: str, elisp_dir: str):
     """Entrypoint for running all checks."""
     if not validate_recipe(recipe):
         _fail(f"Recipe '{recipe}' appears to be invalid")
         return
-    check_containerized_build(recipe, elisp_dir)
-    print_packaging(recipe, elisp_dir)
+    checks = {
+        'preflight': check_preflight,
+        'build': check_containerized_build,
+        'packaging': print_packaging,
+    }
+    gated_stages = _env_list('MELPAZOID_GATED_STAGES', GATED_STAGES)
+    for stage in _env_list('MELPAZOID_STAGES', STAGES):
+        if stage not in checks:
+            _fail(f"Unknown stage '{stage}' (expected one of: {', '.join(checks)})")
+            return
+        with _stage(stage):
+            checks[stage](recipe, elisp_dir)
+        if stage in gated_stages and _RETURN_CODE != 0:
+            _note(f"Skipping the remaining stages after {stage} failed", CLR_ERROR)
+            return
+
+
+def _run_shared_checks(recipes: List[str], elisp_dir: str):
+    """Run the checks for RECIPES, whose sources are all in ELISP_DIR.
+    Each stage runs for each recipe in turn, except that the build stage
+    checks them all in one container run; findings are reported per recipe.
+    """
+    checks = {
+        'preflight': check_preflight,
+        'build': check_containerized_build,
+        'packaging': print_packaging,
+    }
+    gated_stages = _env_list('MELPAZOID_GATED_STAGES', GATED_STAGES)
+    reports = {recipe: io.StringIO() for recipe in recipes}
+    return_codes = {recipe: 0 for recipe in recipes}
+    stopped = set()
+    for recipe in recipes:
+        if not validate_recipe(recipe):
+            with _reporting_to(reports[recipe], 0):
+                _fail(f"Recipe '{recipe}' appears to be invalid")
+            return_codes[recipe] = _RETURN_CODE
+            stopped.add(recipe)
+    for stage in _env_list('MELPAZOID_STAGES', STAGES):
+        if stage not in checks:
+            _fail(f"Unknown stage '{stage}' (expected one of: {', '.join(checks)})")
+            return
+        running = [recipe for recipe in recipes if recipe not in stopped]
+        if stage == 'build' and running:
+            shared_report = io.StringIO()
+            run_result: Optional[subprocess.CompletedProcess] = None
+            with _reporting_to(shared_report, 0):
+                with _stage(stage):
+                    run_result = _run_container(running, elisp_dir)
+            shared_return_code = _RETURN_CODE
+            sections: Dict[str, str] = {}
+            if run_result:
+                sections = _package_sections(run_result.stdout.decode())
+        for recipe in running:
+            with _reporting_to(reports[recipe], return_codes[recipe]):
+                if stage != 'build':
+                    with _stage(stage):
+                        checks[stage](recipe, elisp_dir)
+                else:
+                    print(shared_report.getvalue(), end='')
+                    _return_code(max(_RETURN_CODE, shared_return_code))
+                    if run_result:
+                        _print_container_output(
+                            sections.get(package_name(recipe), ''),
+                            run_result.stderr.decode(),
+                        )
+                if stage in gated_stages and _RETURN_CODE != 0:
+                    _note(
+                        f"Skipping the remaining stages after {stage} failed", CLR_ERROR
+                    )
+                    stopped.add(recipe)
+            return_codes[recipe] = _RETURN_CODE
+    for recipe in recipes:
+        _note(f"## {package_name(recipe)} ##", CLR_INFO)
+        print(reports[recipe].getvalue())
+    _return_code(max(return_codes.values()))
+
+
+@contextlib.contextmanager
+def _reporting_to(report: io.StringIO, return_code: int) -> Iterator[None]:
+    """Redirect the report into REPORT, starting from RETURN_CODE."""
+    with contextlib.redirect_stdout(report):
+        _return_code(return_code)
+        yield
+
+
+@contextlib.contextmanager
+def _stage(name: str) -> Iterator[None]:
+    """Run a stage under its deadline, and account for its resource usage.
+    A stage that runs out of time is reported as a failure (not raised).
+    CPU time covers this process and its children (e.g. Emacs, git, make),
+    but not the processes inside the container.  The kernel only keeps the
+    peak RSS of the whole process tree, so that's the peak so far, not the
+    stage's own.  Bytes fetched by lookups in background threads aren't
+    counted against the stage (see melpazoid_background_fetched_bytes_total).
+    """
+    global _DEADLINE
+    timeout = float(
+        os.environ.get(f"MELPAZOID_TIMEOUT_{name.upper()}", STAGE_TIMEOUTS[name])
+    )
+    outer_deadline = _DEADLINE
+    _DEADLINE = time.monotonic() + timeout
+    if outer_deadline is not None:
+        _DEADLINE = min(_DEADLINE, outer_deadline)
+    start_time = time.monotonic()
+    start_cpu = _cpu_time()
+    start_bytes = _BYTES_FETCHED
+    try:
+        yield
+    except subprocess.TimeoutExpired:
+        _fail(f"- The {name} stage was stopped after its {timeout:g}s deadline")
+        _count('melpazoid_stage_timeouts_total', stage=name)
+    finally:
+        _DEADLINE = outer_deadline
+        _USAGE[name] = {
+            'wall_seconds': time.monotonic() - start_time,
+            'cpu_seconds': _cpu_time() - start_cpu,
+            'peak_rss_so_far_bytes': 1024
+            * max(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            ),
+            'fetched_bytes': _BYTES_FETCHED - start_bytes,
+        }
+        print(
+            f"[{name}: {_USAGE[name]['wall_seconds']:.1f}s wall,"
+            f" {_USAGE[name]['cpu_seconds']:.1f}s CPU,"
+            f" {_USAGE[name]['peak_rss_so_far_bytes'] / 2 ** 20:.0f}MB peak RSS so far,"
+            f" {_USAGE[name]['fetched_bytes'] / 2 ** 20:.1f}MB fetched]",
+            file=sys.stderr,
+        )
+        _observe('melpazoid_stage_seconds', _USAGE[name]['wall_seconds'], stage=name)
+        _log('stage', stage=name, **_USAGE[name])
+
+
+def _cpu_time() -> float:
+    """Return the CPU time used so far by this process and its children."""
+    return sum(
+        usage.ru_utime + usage.ru_stime
+        for usage in (
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+        )
+    )
+
+
+def _run(args: List[str], **kwargs) -> subprocess.CompletedProcess:
+    """Like subprocess.run, but bounded by the current stage's deadline.
+    When time runs out, the process and everything it started are killed,
+    and subprocess.TimeoutExpired is raised.  The process runs in its own
+    session, so it doesn't see the terminal's Ctrl-C; it's killed (along
+    with everything it started) on KeyboardInterrupt or any other error too.
+    >>> _run(['echo', 'hi'], stdout=subprocess.PIPE).stdout
+    b'hi\\n'
+    """
+    timeout = None if _DEADLINE is None else max(0.0, _DEADLINE - time.monotonic())
+    with subprocess.Popen(args, start_new_session=True, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except BaseException:  # e.g. subprocess.TimeoutExpired, KeyboardInterrupt
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            raise
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+def _get(url: str) -> requests.Response:
+    """Like requests.get, but with a timeout and counting the bytes fetched."""
+    global _BYTES_FETCHED
+    response = requests.get(url, timeout=REQUEST_TIMEOUT)
+    if threading.current_thread() is threading.main_thread():
+        with _USAGE_LOCK:
+            _BYTES_FETCHED += len(response.content)
+    else:  # a background lookup, which may overlap any stage
+        _count('melpazoid_background_fetched_bytes_total', len(response.content))
+    _count(
+        'melpazoid_http_requests_total',
+        host=urllib.parse.urlparse(url).netloc,
+        status=str(response.status_code),
+    )
+    if 'X-RateLimit-Remaining' in response.headers:
+        remaining = float(response.headers['X-RateLimit-Remaining'])
+        _set_gauge('melpazoid_github_ratelimit_remaining', remaining)
+    return response
+
+
+def _env_list(name: str, default: List[str]) -> List[str]:
+    """Return the comma-separated list in env var NAME, else DEFAULT.
+    >>> _env_list('MELPAZOID_UNSET_VARIABLE', ['a'])
+    ['a']
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _locked_cache(function):
+    """Like functools.lru_cache(), but safe to call from several threads.
+    A caller waits for any call already in progress (e.g. one started in the
+    background) to finish and fill the cache, instead of repeating its work.
+    """
+    cached_function = functools.lru_cache()(function)
+    lock = threading.Lock()
+
+    @functools.wraps(function)
+    def locked_function(*args):
+        with lock:
+            return cached_function(*args)
+
+    locked_function.cache_info = cached_function.cache_info  # type: ignore
+    locked_function.cache_clear = cached_function.cache_clear  # type: ignore
+    return locked_function
+
+
+def _count(name: str, amount: float = 1, **labels: str):
+    """Add AMOUNT to the counter NAME with LABELS."""
+    key = tuple(sorted(labels.items()))
+    with _USAGE_LOCK:
+        series = _METRICS.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def _set_gauge(name: str, value: float, **labels: str):
+    """Set the gauge NAME with LABELS to VALUE."""
+    with _USAGE_LOCK:
+        _METRICS.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+
+def _observe(name: str, value: float, **labels: str):
+    """Record VALUE in the histogram NAME with LABELS."""
+    for bucket in HISTOGRAM_BUCKETS:
+        _count(f"{name}_bucket", int(value <= bucket), **labels, le=f"{bucket:g}")
+    _count(f"{name}_bucket", 1, **labels, le='+Inf')
+    _count(f"{name}_sum", value, **labels)
+    _count(f"{name}_count", 1, **labels)
+
+
+def _prometheus_text() -> str:
+    """Return the metrics recorded so far in Prometheus' text format.
+    >>> _METRICS.clear()
+    >>> _count('melpazoid_reviews_total', result='pass')
+    >>> _count('melpazoid_reviews_total', 2, result='fail')
+    >>> print(_prometheus_text(), end='')
+    # HELP melpazoid_reviews_total Reviews completed, by result.
+    # TYPE melpazoid_reviews_total counter
+    melpazoid_reviews_total{result="pass"} 1
+    melpazoid_reviews_total{result="fail"} 2
+    >>> _METRICS.clear()
+    """
+    with _USAGE_LOCK:
+        metrics = {name: dict(series) for name, series in _METRICS.items()}
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        suffixes = ['_bucket', '_sum', '_count'] if metric_type == 'histogram' else ['']
+        if not any(name + suffix in metrics for suffix in suffixes):
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for suffix in suffixes:
+            for labels, value in metrics.get(name + suffix, {}).items():
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+                label_text = '{' + label_text + '}' if label_text else ''
+                value_text = str(int(value)) if value == int(value) else repr(value)
+                lines.append(f"{name}{suffix}{label_text} {value_text}")
+    return ''.join(line + '\n' for line in lines)
+
+
+def _collect_cache_metrics():
+    """Fold the hits and misses of melpazoid's in-memory caches into the metrics."""
+    caches = {
+        'known_packages': _known_packages,
+        'repo_info': repo_info_github,
+        'pr_recipe': _filename_and_recipe,
+        'build_script': run_build_script,
+    }
+    for cache, function in caches.items():
+        info = function.cache_info()
+        for result, value in (('hit', info.hits), ('miss', info.misses)):
+            key = (('cache', cache), ('result', result))
+            with _USAGE_LOCK:
+                _METRICS.setdefault('melpazoid_cache_requests_total', {})[key] = value
+
+
+def _export_metrics():
+    """Write the metrics to MELPAZOID_METRICS_FILE, if it's set.
+    The file is replaced atomically, so it suits e.g. node_exporter's
+    textfile collector.
+    """
+    metrics_file = os.environ.get('MELPAZOID_METRICS_FILE')
+    if not metrics_file:
+        return
+    _collect_cache_metrics()
+    scratch = f"{metrics_file}.{os.getpid()}"
+    with open(scratch, 'w') as file:
+        file.write(_prometheus_text())
+    os.replace(scratch, metrics_file)
+
+
+def _serve_metrics(address: str, port: int):
+    """Serve the metrics on http://ADDRESS:PORT/metrics in the background."""
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            _collect_cache_metrics()
+            body = _prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # keep the report clean
+
+    server = http.server.HTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def _log(event: str, **fields: Any):
+    """Append EVENT as a JSON line to MELPAZOID_LOG_FILE, if it's set."""
+    log_file = os.environ.get('MELPAZOID_LOG_FILE')
+    if not log_file:
+        return
+    line = json.dumps({'time': time.time(), 'event': event, **fields})
+    if log_file == '-':
+        print(line, file=sys.stderr)
+    else:
+        with open(log_file, 'a') as file:
+            file.write(line + '\n')
+
+
+def _record_review(target: str, start_time: float):
+    """Record the result of reviewing TARGET, which started at START_TIME."""
+    result = 'pass' if _return_code() == 0 else 'fail'
+    seconds = time.monotonic() - start_time
+    _count('melpazoid_reviews_total', result=result)
+    _observe('melpazoid_review_seconds', seconds)
+    _log('review', target=target, result=result, seconds=seconds)
+    _export_metrics()
 
 
 def _return_code(return_code: int = None) -> int:
@@ -110,28 +534,118 @@ def _fail(message: str, color: str = CLR_ERROR, highlight: str = None):
     _return_code(2)
 
 
+def check_preflight(recipe: str, elisp_dir: str):
+    """Run the cheap checks that a package can't pass without.
+    These need no container, and print nothing unless there's a problem.
+    """
+    problems = []
+    files = _files_in_recipe(recipe, elisp_dir)
+    main_file = _main_file(files, recipe)
+    if not main_file:
+        problems.append(f"- No .el file matches the name '{package_name(recipe)}'")
+    elif main_file.endswith('.el') and not main_file.endswith('-pkg.el'):
+        with open(main_file) as stream:
+            if _header(stream) is None:
+                problems.append(f"- {os.path.basename(main_file)} has no header line")
+    if _fetcher(recipe) == 'gitlab' and (':repo' not in recipe or ':url' in recipe):
+        problems.append(
+            '- With the GitLab fetcher you MUST set :repo and you MUST NOT set :url'
+        )
+    if not _license_file(elisp_dir) and not _any_license_boilerplate(files):
+        problems.append('- Add a LICENSE or COPYING file to the repository')
+    if problems:
+        _note('### Preflight ###\n', CLR_INFO)
+        for problem in problems:
+            _fail(problem)
+        print()
+
+
+def _any_license_boilerplate(files: List[str]) -> bool:
+    """Return whether any of the elisp files has license boilerplate."""
+    for file in files:
+        if file.endswith('.el') and not file.endswith('-pkg.el'):
+            with open(file) as stream:
+                if _check_file_for_license_boilerplate(stream):
+                    return True
+    return False
+
+
 def check_containerized_build(recipe: str, elisp_dir: str):
     """Build a Docker container with the package installed."""
-    print(f"Building container for {package_name(recipe)}... 🐳")
-    # first, copy over only the recipe's files:
+    run_result = _run_container([recipe], elisp_dir)
+    if run_result:
+        _print_container_output(run_result.stdout.decode(), run_result.stderr.decode())
+
+
+def _run_container(
+    recipes: List[str], elisp_dir: str
+) -> Optional[subprocess.CompletedProcess]:
+    """Check RECIPES, whose sources are all in ELISP_DIR, in one container run.
+    A single package is checked at the top of the container's package
+    directory; several are each checked in their own subdirectory, and the
+    output for each starts with a '## NAME ##' line.
+    Return None if the dependencies couldn't be installed.
+    """
+    names = [package_name(recipe) for recipe in recipes]
+    print(f"Building container for {', '.join(names)}... 🐳")
     shutil.rmtree(_PKG_SUBDIR, ignore_errors=True)
+    reqs: Set[str] = set()
+    versioned_reqs: Set[str] = set()
+    main_files = []
+    for recipe in recipes:
+        subdir = package_name(recipe) if len(recipes) > 1 else ''
+        files = _copy_recipe_files(recipe, elisp_dir, os.path.join(_PKG_SUBDIR, subdir))
+        reqs |= requirements(files, recipe)
+        versioned_reqs |= requirements(files, recipe, with_versions=True)
+        main_file = os.path.basename(_main_file(files, recipe))
+        main_files.append(os.path.join(package_name(recipe), main_file))
+    # packages checked together are checked from source, not installed:
+    deps_dir = _dependencies_dir(
+        reqs - set(names),
+        {req for req in versioned_reqs if req.split()[0] not in names},
+    )
+    if not deps_dir:
+        return None
+    if len(recipes) > 1:
+        package = f"MELPAZOID_PACKAGES={' '.join(main_files)}"
+    else:
+        package = f"PACKAGE_MAIN={os.path.basename(main_files[0])}"
+    run_result = _make('test', package, f"DEPS_DIR={deps_dir}")
+    if 'Error 137' in run_result.stderr.decode():  # i.e. SIGKILL, usually OOM
+        _count('melpazoid_container_failures_total', reason='killed')
+    return run_result
+
+
+def _copy_recipe_files(recipe: str, elisp_dir: str, target_dir: str) -> List[str]:
+    """Copy only the recipe's files from ELISP_DIR to TARGET_DIR.
+    Return the copied files' new paths.
+    """
     files = [os.path.relpath(f, elisp_dir) for f in _files_in_recipe(recipe, elisp_dir)]
     for ii, file in enumerate(files):
         target = os.path.basename(file) if file.endswith('.el') else file
-        target = os.path.join(_PKG_SUBDIR, target)
+        target = os.path.join(target_dir, target)
         os.makedirs(os.path.dirname(target), exist_ok=True)
         subprocess.run(['cp', '-r', os.path.join(elisp_dir, file), target])
         files[ii] = target
-    _write_requirements(files, recipe)
-    package_main = os.path.basename(_main_file(files, recipe))
-    run_result = subprocess.run(
-        ['make', '-C', _MELPAZOID_ROOT, 'test', f"PACKAGE_MAIN={package_main}"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    lines = run_result.stdout.decode().strip().split('\n')
-    if run_result.stderr:
-        lines += ['```', run_result.stderr.decode().strip(), '```']
+    return files
+
+
+def _package_sections(output: str) -> Dict[str, str]:
+    """Split the output of a container that checked several packages by package.
+    >>> _package_sections('## a ##\\n### a.el ###\\n## b ##\\n### b.el ###\\n')
+    {'a': '### a.el ###\\n', 'b': '### b.el ###\\n'}
+    """
+    sections = re.split(r'^## (\S+) ##\n', output, flags=re.M)
+    return dict(zip(sections[1::2], sections[2::2]))
+
+
+def _print_container_output(stdout: str, stderr: str):
+    """Print the output of a container run, highlighting its findings."""
+    lines = stdout.strip().split('\n')
+    if stderr:
+        lines += ['```', stderr.strip(), '```']
+    if 'Error 137' in stderr:  # i.e. SIGKILL, usually OOM
+        _fail('- The container was killed; did it run out of memory?')
     for line in lines:
         # byte-compile-file writes ":Error: ", package-lint ": error: "
         if ':Error: ' in line or ': error: ' in line:
@@ -147,6 +661,35 @@ def check_containerized_build(recipe: str, elisp_dir: str):
 
 def _files_in_recipe(recipe: str, elisp_dir: str) -> List[str]:
     """Return a file listing, relative to elisp_dir."""
+    return _expand_files_specs(elisp_dir, [_files_spec(recipe)])[0]
+
+
+def _files_in_recipe_package_build(recipe: str, elisp_dir: str) -> List[str]:
+    """Return the same file listing as _files_in_recipe, using package-build.
+    This is the reference implementation, i.e. both should always agree:
+    >>> tree = ['a.el', 'a-pkg.el', 'a-tests.el', '.dir-locals.el', 'README.md',
+    ...         'lisp/b.el', 'lisp/b-test.el', 'doc/a.texi', 'docs/dir',
+    ...         'sub/c.el', 'sub/d/e.el', 'sub/d/f.txt', 'g.el.in']
+    >>> recipes = [
+    ...     '(a :fetcher github :repo "x/a")',
+    ...     '(a :fetcher github :repo "x/a" :files (:defaults "sub/*.el"))',
+    ...     '(a :fetcher github :repo "x/a" :files ("*.el" "lisp/*" (:exclude "a-*")))',
+    ...     '(a :fetcher github :repo "x/a" :files (("s" "sub/*") (:exclude "sub/d")))',
+    ...     '(a :fetcher github :repo "x/a" :files ("*.el" (:exclude "*.el") "a.el"))',
+    ...     '(a :fetcher github :repo "x/a" :files ("sub/*/*" "READ?E.[a-z]d"))',
+    ...     '(a :fetcher github :repo "x/a" :files ("a.el" "lisp"))',
+    ...     '(a :fetcher github :repo "x/a" :files (("s" "sub/*" (:exclude "sub/c.el"))))',
+    ...     '(a :fetcher github :repo "x/a" :files ("*.el" "*.el.in"))',
+    ... ]
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     for file in tree:
+    ...         os.makedirs(os.path.dirname(os.path.join(tmpdir, 'a', file)), exist_ok=True)
+    ...         open(os.path.join(tmpdir, 'a', file), 'w').close()
+    ...     elisp_dir = os.path.join(tmpdir, 'a')
+    ...     [_files_in_recipe(recipe, elisp_dir)
+    ...      == _files_in_recipe_package_build(recipe, elisp_dir) for recipe in recipes]
+    [True, True, True, True, True, True, True, True, True]
+    """
     files = run_build_script(
         f"""
         (require 'package-build)
@@ -158,16 +701,198 @@ def _files_in_recipe(recipe: str, elisp_dir: str) -> List[str]:
         """
     ).split('\n')
     files = [os.path.join(elisp_dir, file) for file in files]
-    return sorted(file for file in files if os.path.exists(file))
+    return sorted(set(file for file in files if os.path.exists(file)))
+
+
+# package-build's `package-build-default-files-spec', as last seen; the checks
+# read the live one (see _default_files_spec) and only fall back to this copy
+DEFAULT_FILES_SPEC: list = [
+    '*.el',
+    'lisp/*.el',
+    'dir',
+    '*.info',
+    '*.texi',
+    '*.texinfo',
+    'doc/dir',
+    'doc/*.info',
+    'doc/*.texi',
+    'doc/*.texinfo',
+    'docs/dir',
+    'docs/*.info',
+    'docs/*.texi',
+    'docs/*.texinfo',
+    [
+        ':exclude',
+        '.dir-locals.el',
+        'lisp/.dir-locals.el',
+        'test.el',
+        'tests.el',
+        '*-test.el',
+        '*-tests.el',
+        'lisp/test.el',
+        'lisp/tests.el',
+        'lisp/*-test.el',
+        'lisp/*-tests.el',
+    ],
+]
 
 
-def _files_in_default_recipe(recipe: str, elisp_dir: str) -> list:
+@functools.lru_cache()
+def _default_files_spec() -> list:
+    """Return package-build's `package-build-default-files-spec'.
+    It's read from the package-build.el that the build uses, so it follows
+    MELPA's defaults.  If that can't be fetched or read, warn and fall back
+    to DEFAULT_FILES_SPEC.
+    """
     try:
-        return _files_in_recipe(_default_recipe(recipe), elisp_dir)
-    except ChildProcessError:
-        # It is possible that the default recipe is completely invalid and
-        # will throw an error -- in that case, just return the empty list:
-        return []
+        with open(os.path.join(_package_build_dir(), 'package-build.el')) as file:
+            spec = _parse_default_files_spec(file.read())
+    except requests.RequestException:
+        spec = None
+    if spec is None:
+        print("Unable to read package-build's default :files spec", file=sys.stderr)
+        return DEFAULT_FILES_SPEC
+    if spec != DEFAULT_FILES_SPEC:
+        print("package-build's default :files spec changed", file=sys.stderr)
+    return spec
+
+
+def _parse_default_files_spec(package_build_el: str) -> Optional[list]:
+    """Return the `package-build-default-files-spec' defined in package-build.el.
+    >>> _parse_default_files_spec('''(defconst package-build-default-files-spec
+    ...   '("*.el" "lisp/*.el" (:exclude ".dir-locals.el" "test.el"))
+    ...   "Default value for :files attribute in recipes.")
+    ... (defun package-build--x () ?\\")''')
+    ['*.el', 'lisp/*.el', [':exclude', '.dir-locals.el', 'test.el']]
+    """
+    definition = re.search(
+        r"^\(def(?:const|var|custom)\s+package-build-default-files-spec\s+'",
+        package_build_el,
+        flags=re.M,
+    )
+    if not definition:
+        return None
+    # only tokenize up to the next top-level form:
+    end = package_build_el.find('\n(', definition.end())
+    try:
+        tokens = _tokenize_recipe(package_build_el[definition.end() : end])
+        spec, _ = _nested_tokens(tokens, 0)
+    except (ValueError, IndexError):
+        return None
+    return spec if isinstance(spec, list) and spec else None
+
+
+def _files_spec(recipe: str) -> list:
+    """Return the recipe's :files spec as (nested) lists of strings.
+    >>> _files_spec('(a :repo "b/a" :fetcher github :files (:defaults (:exclude "x.el")))')
+    [':defaults', [':exclude', 'x.el']]
+    """
+    tokens = _tokenize_expression(recipe)
+    if ':files' not in tokens:
+        return _default_files_spec()
+    spec, _ = _nested_tokens(tokens, tokens.index(':files') + 1)
+    return spec if isinstance(spec, list) and spec else _default_files_spec()
+
+
+def _nested_tokens(tokens: List[str], start: int) -> Tuple[Any, int]:
+    """Turn the expression at tokens[start] into a string or nested lists.
+    Also return the index just after the expression.
+    >>> _nested_tokens(['(', '"a.el"', '(', ':exclude', '"b.el"', ')', ')'], 0)
+    (['a.el', [':exclude', 'b.el']], 7)
+    """
+    if tokens[start] != '(':
+        return tokens[start].strip('"'), start + 1
+    expression = []
+    index = start + 1
+    while tokens[index] != ')':
+        item, index = _nested_tokens(tokens, index)
+        expression.append(item)
+    return expression, index + 1
+
+
+def _expand_files_specs(elisp_dir: str, specs: List[list]) -> List[List[str]]:
+    """Expand each :files spec against elisp_dir, as package-build would.
+    The directory is walked once (and only as deep as the specs reach), and
+    every spec is then matched against that one listing.
+    """
+    depth = max((pattern.count('/') for pattern in _spec_patterns(specs)), default=0)
+    paths = _scan_tree(elisp_dir, depth + 1)
+    return [
+        sorted(
+            os.path.join(elisp_dir, file) for file in _expand_files_spec(spec, paths)
+        )
+        for spec in specs
+    ]
+
+
+def _spec_patterns(spec: list) -> Iterator[str]:
+    """Yield every file pattern in the (nested) spec."""
+    for entry in spec:
+        if isinstance(entry, list):
+            yield from _spec_patterns(entry[1:])
+        elif not entry.startswith(':'):
+            yield entry
+        elif entry == ':defaults':
+            yield from _spec_patterns(_default_files_spec())
+
+
+def _scan_tree(root: str, depth: int) -> Set[str]:
+    """Return the relative paths of everything at most depth levels under root.
+    Version control directories are listed, but not descended into.
+    """
+    paths: Set[str] = set()
+    directories = [('', 1)]
+    while directories:
+        prefix, level = directories.pop()
+        with os.scandir(os.path.join(root, prefix)) as entries:
+            for entry in entries:
+                path = prefix + entry.name
+                paths.add(path)
+                if level < depth and entry.name not in {'.git', '.hg'}:
+                    if entry.is_dir():
+                        directories.append((path + '/', level + 1))
+    return paths
+
+
+def _expand_files_spec(spec: list, paths: Set[str]) -> Set[str]:
+    """Return which of the paths the :files spec selects.
+    This follows `package-build--expand-file-specs': entries are applied in
+    order, so an :exclude only removes what the entries before it matched.
+    >>> paths = {'a.el', 'a-test.el', 'lisp', 'lisp/b.el', 'doc', 'doc/a.texi', 'x'}
+    >>> sorted(_expand_files_spec(DEFAULT_FILES_SPEC, paths))
+    ['a.el', 'doc/a.texi', 'lisp/b.el']
+    >>> sorted(_expand_files_spec([*DEFAULT_FILES_SPEC, 'x', [':exclude', '*/*']], paths))
+    ['a.el', 'x']
+    >>> sorted(_expand_files_spec([['target', '?-*.el'], [':exclude', 'b.el']], paths))
+    ['a-test.el']
+    """
+    if spec and spec[0] == ':defaults':
+        spec = _default_files_spec() + spec[1:]
+    files: Set[str] = set()
+    for entry in spec:
+        if isinstance(entry, list) and entry and entry[0] == ':exclude':
+            files -= _expand_files_spec(entry[1:], paths)
+        elif isinstance(entry, list):  # a subdirectory target: (target . spec)
+            files |= _expand_files_spec(entry[1:], paths)
+        else:
+            files |= _wildcard_matches(entry, paths)
+    return files
+
+
+def _wildcard_matches(pattern: str, paths: Set[str]) -> Set[str]:
+    """Return the paths that match the pattern, per `file-expand-wildcards'.
+    >>> sorted(_wildcard_matches('*/*.el', {'a.el', 'b/c.el', 'b/d/e.el'}))
+    ['b/c.el']
+    """
+    if not re.search(r'[\[*?]', pattern):
+        return {pattern} if pattern in paths else set()
+    parts = pattern.split('/')
+    return {
+        path
+        for path in paths
+        if path.count('/') == len(parts) - 1
+        and all(map(fnmatch.fnmatchcase, path.split('/'), parts))
+    }
 
 
 def _set_branch(recipe: str, branch_name: str) -> str:
@@ -254,15 +979,84 @@ def _main_file(files: List[str], recipe: str) -> str:
         return ''
 
 
-def _write_requirements(files: List[str], recipe: str):
-    """Create a little elisp script that Docker will run as setup."""
-    with open('_requirements.el', 'w') as requirements_el:
-        # NOTE: emacs --script <file.el> will set `load-file-name' to <file.el>
-        # which can disrupt the compilation of packages that use that variable:
-        requirements_el.write('(let ((load-file-name nil))')
-        requirements_el.write(
-            '''
+def _make(target: str, *variables: str) -> subprocess.CompletedProcess:
+    """Run a target in melpazoid's Makefile, under the current deadline."""
+    container_name = f"melpazoid-{os.getpid()}"
+    try:
+        return _run(
+            ['make', '-C', _MELPAZOID_ROOT, target, f"CONTAINER_NAME={container_name}"]
+            + list(variables),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except BaseException as exception:  # e.g. a timeout or Ctrl-C
+        if isinstance(exception, subprocess.TimeoutExpired):
+            _count('melpazoid_container_failures_total', reason='timeout')
+        # killing the docker client doesn't stop the container itself:
+        subprocess.run(
+            ['docker', 'rm', '--force', container_name],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        raise
+
+
+def _dependencies_dir(reqs: Set[str], versioned_reqs: Set[str]) -> str:
+    """Return a directory with the packages REQS installed in it.
+    These directories are cached by the script that installs them, the
+    versions required (VERSIONED_REQS), and the week (or TOOLS_VERSION), so
+    each set of dependencies is installed once and then mounted (read-only)
+    into every container that needs it, and is reinstalled weekly, like the
+    tools, to pick up new releases.  Return '' if the install failed.
+    """
+    script = _requirements_el(reqs)
+    key = script + '\n'.join(sorted(versioned_reqs))
+    key += os.environ.get('TOOLS_VERSION') or time.strftime('%G-W%V')
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    deps_dir = os.path.join(_CACHE_DIR, 'deps', digest)
+    if os.path.isdir(deps_dir):
+        _count('melpazoid_cache_requests_total', cache='deps', result='hit')
+        return os.path.join(deps_dir, 'elpa')
+    _count('melpazoid_cache_requests_total', cache='deps', result='miss')
+    os.makedirs(os.path.dirname(deps_dir), exist_ok=True)
+    for entry in os.scandir(os.path.dirname(deps_dir)):  # drop older installs
+        if time.time() - entry.stat().st_mtime > DEPS_MAX_AGE:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    scratch = tempfile.mkdtemp(dir=os.path.dirname(deps_dir))
+    with open(os.path.join(scratch, '_requirements.el'), 'w') as requirements_el:
+        requirements_el.write(script)
+    try:
+        run_result = _make(
+            'deps',
+            f"DEPS_DIR={os.path.join(scratch, 'elpa')}",
+            f"REQUIREMENTS={os.path.join(scratch, '_requirements.el')}",
+        )
+    except BaseException:  # e.g. a timeout or Ctrl-C
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+    if run_result.returncode != 0:
+        shutil.rmtree(scratch, ignore_errors=True)
+        _count('melpazoid_container_failures_total', reason='deps')
+        _fail('- Unable to install the dependencies:')
+        print('```', run_result.stderr.decode().strip(), '```', sep='\n')
+        return ''
+    try:
+        os.rename(scratch, deps_dir)
+    except OSError:  # another run got there first
+        shutil.rmtree(scratch, ignore_errors=True)
+    return os.path.join(deps_dir, 'elpa')
+
+
+def _requirements_el(reqs: Set[str]) -> str:
+    """Return a little elisp script that installs the packages REQS.
+    It installs them into /workspace/deps, where it's run by `make deps'.
+    """
+    # NOTE: emacs --script <file.el> will set `load-file-name' to <file.el>
+    # which can disrupt the compilation of packages that use that variable:
+    script = '(let ((load-file-name nil))'
+    script += '''
             (require 'package)
+            (setq package-user-dir "/workspace/deps")
             (package-initialize)
             (setq package-archives nil)
             ;; FIXME: is it still necessary to use GNU elpa mirror?
@@ -270,20 +1064,17 @@ def _write_requirements(files: List[str], recipe: str):
             (add-to-list 'package-archives '("melpa" . "http://melpa.org/packages/"))
             (add-to-list 'package-archives '("org"   . "http://orgmode.org/elpa/"))
             (package-refresh-contents)
-            (package-reinstall 'package-lint)
             '''
-        )
-        for req in requirements(files, recipe):
-            if req == 'org':
-                # TODO: is there a cleaner way to install a recent version of org?!
-                requirements_el.write(
-                    "(package-install (cadr (assq 'org package-archive-contents)))"
-                )
-            elif req != 'emacs':
-                # TODO check if we need to reinstall outdated package?
-                # e.g. (package-installed-p 'map (version-to-list "2.0"))
-                requirements_el.write(f"(package-install '{req})\n")
-        requirements_el.write(') ; end let')
+    for req in sorted(reqs):
+        if req == 'org':
+            # TODO: is there a cleaner way to install a recent version of org?!
+            script += "(package-install (cadr (assq 'org package-archive-contents)))"
+        elif req != 'emacs':
+            # TODO check if we need to reinstall outdated package?
+            # e.g. (package-installed-p 'map (version-to-list "2.0"))
+            script += f"(package-install '{req})\n"
+    script += ') ; end let'
+    return script
 
 
 def requirements(
@@ -365,7 +1156,7 @@ def _check_license_github(clone_address: str) -> bool:
     return True
 
 
-@functools.lru_cache()
+@_locked_cache
 def repo_info_github(clone_address: str) -> dict:
     """What does the GitHub API say about the repo?"""
     if clone_address.endswith('.git'):
@@ -373,7 +1164,7 @@ def repo_info_github(clone_address: str) -> dict:
     match = re.search(r'github.com/([^"]*)', clone_address, flags=re.I)
     if not match:
         return {}
-    response = requests.get(f"{GITHUB_API}/{match.groups()[0].rstrip('/')}")
+    response = _get(f"{GITHUB_API}/{match.groups()[0].rstrip('/')}")
     if not response.ok:
         return {}
     return dict(response.json())
@@ -381,16 +1172,24 @@ def repo_info_github(clone_address: str) -> dict:
 
 def _check_license_file(elisp_dir: str) -> bool:
     """Scan any COPYING or LICENSE files."""
-    for license_ in glob.glob(os.path.join(elisp_dir, '*')):
-        license_ = os.path.basename(license_)
-        if re.match('LICENSE|COPYING|UNLICENSE', license_, flags=re.I):
-            with open(os.path.join(elisp_dir, license_)) as stream:
-                print(f"- {license_} excerpt: `{stream.readline().strip()}...`")
-            return True
+    license_ = _license_file(elisp_dir)
+    if license_:
+        with open(os.path.join(elisp_dir, license_)) as stream:
+            print(f"- {license_} excerpt: `{stream.readline().strip()}...`")
+        return True
     _fail('- Add a LICENSE or COPYING file to the repository')
     return False
 
 
+def _license_file(elisp_dir: str) -> str:
+    """Return the name of the first COPYING or LICENSE file, if any."""
+    for license_ in sorted(glob.glob(os.path.join(elisp_dir, '*'))):
+        license_ = os.path.basename(license_)
+        if re.match('LICENSE|COPYING|UNLICENSE', license_, flags=re.I):
+            return license_
+    return ''
+
+
 def _check_files_for_license_boilerplate(recipe: str, elisp_dir: str) -> bool:
     """Check a recipe for license boilerplate."""
     files = _files_in_recipe(recipe, elisp_dir)
@@ -467,12 +1266,8 @@ def _check_license(recipe: str, elisp_dir: str):
             _note(f"- {relpath} -- consider excluding; MELPA creates one", CLR_WARN)
             continue
         with open(file) as stream:  # definitely an elisp file
-            try:
-                header = stream.readline()
-                header = header.split('-*-')[0]
-                header = header.split(' --- ')[1]
-                header = header.strip()
-            except (IndexError, UnicodeDecodeError):
+            header = _header(stream)
+            if header is None:
                 header = f"{CLR_ERROR}(no header){CLR_OFF}"
                 _return_code(2)
             print(
@@ -482,9 +1277,26 @@ def _check_license(recipe: str, elisp_dir: str):
             )
 
 
+def _header(el_file: TextIO) -> Optional[str]:
+    """Return the summary on an elisp file's header line, or None if it has none.
+    >>> _header(io.StringIO(';;; shx.el --- Extras for comint-mode  -*- lexical-binding: t -*-'))
+    'Extras for comint-mode'
+    >>> _header(io.StringIO(';;; shx.el'))
+    """
+    try:
+        header = el_file.readline()
+        header = header.split('-*-')[0]
+        header = header.split(' --- ')[1]
+        return header.strip()
+    except (IndexError, UnicodeDecodeError):
+        return None
+
+
 def _check_recipe(recipe: str, elisp_dir: str):
-    files = _files_in_recipe(recipe, elisp_dir)
-    use_default_recipe = files == _files_in_default_recipe(recipe, elisp_dir)
+    files, default_files = _expand_files_specs(
+        elisp_dir, [_files_spec(recipe), _default_files_spec()]
+    )
+    use_default_recipe = files == default_files
     if ':branch' in recipe:
         _note('- Avoid specifying `:branch` except in unusual cases', CLR_WARN)
     if _fetcher(recipe) == 'gitlab' and (':repo' not in recipe or ':url' in recipe):
@@ -498,6 +1310,106 @@ def _check_recipe(recipe: str, elisp_dir: str):
             _fail(f"  It seems to be equivalent: `{_default_recipe(recipe)}`")
 
 
+def _lint_recipe(filename: str, recipe: str) -> List[Tuple[str, str]]:
+    """Lint a recipe (from a file called FILENAME) without cloning anything.
+    Return a list of problems as (color, message) pairs.
+    >>> _lint_recipe('shx', '(shx :repo "riscy/shx-for-emacs" :fetcher github)')
+    []
+    >>> _lint_recipe('a', '(a :repo "b/a" :fetcher bitbucket)')
+    []
+    >>> for _, problem in _lint_recipe('x', '(shx :fetcher gitlab :url "a/b" :url "c/d")'):
+    ...     print(problem)
+    Recipe name 'shx' does not match the filename 'x'
+    Duplicate keyword :url
+    With the gitlab fetcher you MUST set :repo and you MUST NOT set :url
+    >>> for _, problem in _lint_recipe('a', '(a :fetcher github :repo "b/a" :files (:defaults))'):
+    ...     print(problem)
+    The :files spec is the default; remove it
+    >>> _lint_recipe('a', '(a :fetcher github :repo "b/a"')[0][1]
+    'Malformed recipe: missing )'
+    """
+    try:
+        tokens = _tokenize_recipe(recipe)
+        expression, end = _nested_tokens(tokens, 0)
+    except ValueError as error:
+        return [(CLR_ERROR, f"Malformed recipe: {error}")]
+    except IndexError:
+        problem = 'Malformed recipe: missing )' if tokens else 'Empty recipe'
+        return [(CLR_ERROR, problem)]
+    if end != len(tokens) or not isinstance(expression, list) or not expression:
+        return [(CLR_ERROR, 'Malformed recipe: expected a single list')]
+    problems = []
+    name, *plist = expression
+    if tokens[1] in ('(', ')') or tokens[1].startswith((':', '"')):
+        return [(CLR_ERROR, 'Malformed recipe: it should start with a package name')]
+    if name != filename:
+        problems.append(
+            (
+                CLR_ERROR,
+                f"Recipe name '{name}' does not match the filename '{filename}'",
+            )
+        )
+    if len(plist) % 2:
+        problems.append((CLR_ERROR, 'Malformed recipe: a keyword is missing its value'))
+    properties: Dict[str, Any] = {}
+    for keyword, value in zip(plist[::2], plist[1::2]):
+        if not isinstance(keyword, str) or keyword not in RECIPE_KEYWORDS:
+            problems.append((CLR_ERROR, f"Unknown keyword {keyword}"))
+        elif keyword in properties:
+            problems.append((CLR_ERROR, f"Duplicate keyword {keyword}"))
+        else:
+            properties[keyword] = value
+    fetcher = str(properties.get(':fetcher', ''))
+    if fetcher in REPO_FETCHERS:
+        if ':repo' not in properties or ':url' in properties:
+            problems.append(
+                (
+                    CLR_ERROR,
+                    f"With the {fetcher} fetcher you MUST set :repo"
+                    ' and you MUST NOT set :url',
+                )
+            )
+    elif fetcher in URL_FETCHERS:
+        if ':url' not in properties or ':repo' in properties:
+            problems.append(
+                (
+                    CLR_ERROR,
+                    f"With the {fetcher} fetcher you MUST set :url"
+                    ' and you MUST NOT set :repo',
+                )
+            )
+    else:
+        problems.append((CLR_ERROR, f"Unknown or missing :fetcher {fetcher}"))
+    files = properties.get(':files')
+    if files == [':defaults'] or (files and files == _default_files_spec()):
+        problems.append((CLR_ERROR, 'The :files spec is the default; remove it'))
+    if ':branch' in properties:
+        problems.append(
+            (CLR_WARN, 'Avoid specifying `:branch` except in unusual cases')
+        )
+    return problems
+
+
+def _tokenize_recipe(recipe: str) -> List[str]:
+    """Turn a recipe into a list of tokens, like _tokenize_expression, but
+    in Python (i.e. without launching Emacs).  Strings keep their quotes.
+    Raise ValueError if a string is unterminated.
+    >>> _tokenize_recipe('(shx :repo "riscy/xyz" :fetcher github) ; comment')
+    ['(', 'shx', ':repo', '"riscy/xyz"', ':fetcher', 'github', ')']
+    >>> _tokenize_recipe('(a :files ("a;b")) ; (b')
+    ['(', 'a', ':files', '(', '"a;b"', ')', ')']
+    """
+    tokens = []
+    token_pattern = r'\s+|;[^\n]*|[()]|"(?:[^"\\]|\\.)*"|"|[^\s()";]+'
+    for match in re.finditer(token_pattern, recipe):
+        token = match.group()
+        if token == '"':
+            raise ValueError('unterminated string')
+        if not token.isspace() and not token.startswith(';'):
+            tokens.append(token)
+    return tokens
+
+
 def _print_package_requires(recipe: str, elisp_dir: str):
     """Print the list of Package-Requires from the 'main' file.
     Report on any mismatches between this file and other files, since the ones
@@ -518,6 +1430,20 @@ def _print_package_requires(recipe: str, elisp_dir: str):
 
 def print_similar_packages(package_name: str):
     """Print list of similar, or at least similarly named, packages."""
+    similar_packages = _similar_packages(package_name)
+    if not similar_packages:
+        return
+    _note('### Similarly named ###\n', CLR_INFO)
+    for name in list(similar_packages)[:10]:
+        print(f"- {name}: {similar_packages[name]}")
+    if package_name in similar_packages:
+        _fail(f"- Error: package '{package_name}' already exists!", highlight='Error:')
+    print()
+
+
+@_locked_cache
+def _similar_packages(package_name: str) -> Dict[str, str]:
+    """Return similar, or at least similarly named, packages and their URLs."""
     keywords = [package_name]
     keywords += [re.sub(r'[0-9]', '', package_name)]
     keywords += [package_name[:-5]] if package_name.endswith('-mode') else []
@@ -528,30 +1454,23 @@ def print_similar_packages(package_name: str):
         **_emacswiki_packages(keywords),
         **_emacsattic_packages(keywords),
     }
-    best_candidates = []
-    for candidate in all_candidates:
-        if any(keyword in candidate for keyword in keywords):
-            best_candidates.append(candidate)
-    if not best_candidates:
-        return
-    _note('### Similarly named ###\n', CLR_INFO)
-    for name in best_candidates[:10]:
-        print(f"- {name}: {all_candidates[name]}")
-    if package_name in all_candidates:
-        _fail(f"- Error: package '{package_name}' already exists!", highlight='Error:')
-    print()
+    return {
+        candidate: url
+        for candidate, url in all_candidates.items()
+        if any(keyword in candidate for keyword in keywords)
+    }
 
 
-@functools.lru_cache()
+@_locked_cache
 def _known_packages() -> dict:
     """Return all known packages in MELPA _and_ the Emacsmirror."""
     melpa_packages = {
         package: f"https://melpa.org/#/{package}"
-        for package in requests.get('http://melpa.org/archive.json').json()
+        for package in _get('http://melpa.org/archive.json').json()
     }
     epkgs = 'https://raw.githubusercontent.com/emacsmirror/epkgs/master/.gitmodules'
     epkgs_parser = configparser.ConfigParser()
-    epkgs_parser.read_string(requests.get(epkgs).text)
+    epkgs_parser.read_string(_get(epkgs).text)
     epkgs_packages = {
         epkg.split('"')[1]: 'https://' + data['url'].replace(':', '/')[4:]
         for epkg, data in epkgs_parser.items()
@@ -569,7 +1488,7 @@ def _emacswiki_packages(keywords: List[str]) -> dict:
     for keyword in keywords:
         el_file = keyword if keyword.endswith('.el') else (keyword + '.el')
         pkg = f"https://github.com/emacsmirror/emacswiki.org/blob/master/{el_file}"
-        if requests.get(pkg).ok:
+        if _get(pkg).ok:
             packages[keyword] = pkg
     return packages
 
@@ -579,7 +1498,7 @@ def _emacsattic_packages(keywords: List[str]) -> dict:
     packages = {}
     for keyword in keywords:
         pkg = f"https://github.com/emacsattic/{keyword}"
-        if requests.get(pkg).ok:
+        if _get(pkg).ok:
             packages[keyword] = pkg
     return packages
 
@@ -608,6 +1527,64 @@ def check_melpa_recipe(recipe: str):
             _run_checks(recipe, elisp_dir)
 
 
+def check_melpa_recipes(recipes: List[str]):
+    """Check several MELPA recipe definitions.
+    Recipes that come from the same repository and branch share a clone, a
+    dependency install, and a container run.
+    """
+    return_code = 0
+    sources: Dict[Tuple[str, str, str], List[str]] = {}
+    for recipe in recipes:
+        source = (_clone_address(recipe), _branch(recipe), _fetcher(recipe))
+        sources.setdefault(source, []).append(recipe)
+    for (clone_address, branch, fetcher), source_recipes in sources.items():
+        _return_code(0)
+        with tempfile.TemporaryDirectory() as elisp_dir:
+            # package-build prefers the directory to be named after the package:
+            elisp_dir = os.path.join(elisp_dir, package_name(source_recipes[0]))
+            if _local_repo():
+                print(f"Using local repository at {_local_repo()}")
+                subprocess.run(['cp', '-r', _local_repo(), elisp_dir])
+                _run_shared_checks(source_recipes, elisp_dir)
+            elif _clone(clone_address, elisp_dir, branch, fetcher):
+                _run_shared_checks(source_recipes, elisp_dir)
+        return_code = max(return_code, _RETURN_CODE)
+    _return_code(return_code)
+
+
+def lint_recipes(directory: str):
+    """Lint every recipe in DIRECTORY (e.g. MELPA's recipes/), in parallel."""
+    _return_code(0)
+    filenames = sorted(
+        entry.path
+        for entry in os.scandir(directory)
+        if entry.is_file() and not entry.name.startswith('.')
+    )
+    _default_files_spec()  # fetch it once, before the workers are forked
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        all_problems = executor.map(_lint_recipe_file, filenames, chunksize=64)
+        linted = 0
+        for filename, problems in zip(filenames, all_problems):
+            linted += 1
+            for color, problem in problems:
+                message = f"- {os.path.basename(filename)}: {problem}"
+                if color == CLR_ERROR:
+                    _fail(message)
+                else:
+                    _note(message, color)
+    print(f"Linted {linted} recipes")
+
+
+def _lint_recipe_file(filename: str) -> List[Tuple[str, str]]:
+    """Lint the recipe in FILENAME."""
+    try:
+        with open(filename) as file:
+            recipe = file.read()
+    except (OSError, UnicodeDecodeError) as error:
+        return [(CLR_ERROR, f"Unable to read the recipe: {error}")]
+    return _lint_recipe(os.path.basename(filename), recipe)
+
+
 def check_license(recipe: str):
     """Check licenses (only)."""
     # TODO: DRY up wrt check_melpa_recipe
@@ -624,6 +1601,203 @@ def check_license(recipe: str):
             _check_license(recipe, elisp_dir)
 
 
+def watch_local_package(recipe: str, directory: str):
+    """Check a local package, then re-check it every time its files change.
+    Only the checks affected by the changed files are re-run, and each run is
+    followed by the findings that have appeared or gone away since the last.
+    """
+    findings: Dict[str, Set[str]] = {}
+    snapshot = _snapshot(directory)
+    changed: Optional[Set[str]] = None  # i.e. everything
+    while True:
+        print(f"Checking {directory}", ', '.join(sorted(changed or [])))
+        new_findings = _watch_checks(recipe, directory, changed)
+        if new_findings is not None:
+            previous_findings = findings
+            findings = {
+                **{k: v for k, v in findings.items() if k not in new_findings},
+                **new_findings,
+            }
+            _print_findings_diff(previous_findings, findings)
+        print('Watching for changes...', file=sys.stderr)
+        snapshot, changed = _wait_for_changes(directory, snapshot)
+
+
+def _watch_checks(
+    recipe: str, elisp_dir: str, changed: Optional[Set[str]]
+) -> Optional[Dict[str, Set[str]]]:
+    """Run the checks affected by the changed files (or all checks, if None).
+    Return the findings of the checks that ran, by report section, or None if
+    the changes affected no checks.
+    """
+    files = [os.path.relpath(f, elisp_dir) for f in _files_in_recipe(recipe, elisp_dir)]
+    el_files = [f for f in files if f.endswith('.el') and not f.endswith('-pkg.el')]
+    # a deleted .el file may have been in the recipe, so re-check every file:
+    deleted = [
+        f
+        for f in changed or set()
+        if f.endswith('.el') and not os.path.exists(os.path.join(elisp_dir, f))
+    ]
+    if changed is None or deleted:
+        changed_el_files = el_files
+    else:  # the files that changed and the files that require them
+        changed_el_files = _requiring_files(
+            elisp_dir, el_files, [f for f in el_files if f in changed]
+        )
+    if changed is not None and not changed_el_files:
+        if not any(
+            f in files or re.match('LICENSE|COPYING|UNLICENSE', f, flags=re.I)
+            for f in changed
+        ):
+            print('- No checks are affected')
+            return None
+    rerun_sections = {'Preflight', 'Package'}
+    for basename in (os.path.basename(f) for f in deleted):
+        rerun_sections |= {basename, f"Loadability {basename}"}
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        _return_code(0)
+        with _stage('preflight'):
+            check_preflight(recipe, elisp_dir)
+        if _RETURN_CODE == 0 and changed_el_files:
+            basenames = [os.path.basename(f) for f in changed_el_files]
+            # an empty MELPAZOID_FILES means melpazoid.el checks every file:
+            os.environ['MELPAZOID_FILES'] = (
+                '' if changed is None or deleted else ' '.join(basenames)
+            )
+            for basename in basenames:
+                rerun_sections |= {basename, f"Loadability {basename}"}
+            with _stage('build'):
+                check_containerized_build(recipe, elisp_dir)
+        with _stage('packaging'):
+            print_packaging(recipe, elisp_dir)
+    print(output.getvalue(), end='')
+    findings = _findings(output.getvalue())
+    return {section: findings.get(section, set()) for section in rerun_sections}
+
+
+def _requiring_files(
+    elisp_dir: str, el_files: List[str], changed: List[str]
+) -> List[str]:
+    """Return the CHANGED files and those EL_FILES that require them.
+    Files that require a changed file through other files are included too;
+    requires are found as in melpazoid.el's `melpazoid--required-files'.
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     for name, text in (('a.el', ''), ('b.el', "(require 'a)"),
+    ...                        ('c.el', "(require 'b)"), ('d.el', "(require 'x)")):
+    ...         with open(os.path.join(tmpdir, name), 'w') as file:
+    ...             _ = file.write(text)
+    ...     _requiring_files(tmpdir, ['a.el', 'b.el', 'c.el', 'd.el'], ['a.el'])
+    ['a.el', 'b.el', 'c.el']
+    """
+    required: Dict[str, Set[str]] = {}
+    for el_file in el_files:
+        with open(os.path.join(elisp_dir, el_file), errors='replace') as file:
+            features = re.findall(r"\(require\s+'([^\s)]+)", file.read())
+        required[el_file] = {feature + '.el' for feature in features}
+    affected = {os.path.basename(f) for f in changed}
+    while True:
+        requiring = {
+            os.path.basename(f) for f in el_files if required[f] & affected
+        } - affected
+        if not requiring:
+            return [f for f in el_files if os.path.basename(f) in affected]
+        affected |= requiring
+
+
+def _findings(output: str) -> Dict[str, Set[str]]:
+    """Split a report's findings into its sections.
+    Statistics (e.g. load times) are left out, since they vary from run to run.
+    >>> _findings('### a.el ###\\n- No issues!\\n- a.el#L1: Bad\\n### Loadability ###\\n'
+    ...           'Loading a.el\\n- require: 1.0ms\\na.el:Error: Emacs errored')
+    {'a.el': {'- a.el#L1: Bad'}, 'Loadability a.el': {'a.el:Error: Emacs errored'}}
+    """
+    findings: Dict[str, Set[str]] = {}
+    section = ''
+    for line in re.sub(r'\033\[[0-9;]*m', '', output).split('\n'):
+        line = line.rstrip()
+        header = re.match(r'### (.*) ###$', line)
+        if header:
+            section = header.group(1)
+        elif section.startswith('Loadability') and line.startswith('Loading '):
+            section = f"Loadability {line[len('Loading '):]}"
+        elif section.startswith('Loadability') and ':Error: ' not in line:
+            continue
+        elif line and line != '```' and line != '- No issues!' and line[-1] != ':':
+            findings.setdefault(section, set()).add(line)
+    findings.pop('', None)
+    return findings
+
+
+def _print_findings_diff(previous: Dict[str, Set[str]], current: Dict[str, Set[str]]):
+    """Print the findings that are new in current, or gone since previous."""
+    _note('### Changes since the previous run ###\n', CLR_INFO)
+    unchanged = True
+    for section in sorted(set(previous) | set(current)):
+        for line in sorted(current.get(section, set()) - previous.get(section, set())):
+            _note(f"+ {section}: {line}", CLR_WARN)
+            unchanged = False
+        for line in sorted(previous.get(section, set()) - current.get(section, set())):
+            _note(f"- {section}: {line}", CLR_INFO)
+            unchanged = False
+    if unchanged:
+        print('- No changes')
+    print()
+
+
+def _snapshot(directory: str) -> Dict[str, Tuple[int, int]]:
+    """Return the modification time and size of each file under directory.
+    Version control directories and editor backup/lock files are skipped.
+    """
+    snapshot = {}
+    directories = ['']
+    while directories:
+        prefix = directories.pop()
+        with os.scandir(os.path.join(directory, prefix)) as entries:
+            for entry in entries:
+                if entry.name in {'.git', '.hg'} or re.match(r'\.?#|.*~$', entry.name):
+                    continue
+                if entry.is_dir():
+                    directories.append(prefix + entry.name + '/')
+                elif entry.is_file():
+                    stat = entry.stat()
+                    snapshot[prefix + entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def _wait_for_changes(
+    directory: str, snapshot: Dict[str, Tuple[int, int]], debounce: float = 0.5
+) -> Tuple[Dict[str, Tuple[int, int]], Set[str]]:
+    """Block until files under directory change and then settle down.
+    Use inotifywait if it's installed, otherwise poll the directory.
+    Return the new snapshot and the (relative) paths that changed.
+    """
+    while True:
+        if shutil.which('inotifywait'):
+            subprocess.run(
+                ['inotifywait', '-qq', '-r', '-e', 'modify,create,delete,move']
+                + ['--exclude', r'/\.(git|hg)/', directory]
+            )
+        else:
+            time.sleep(1)
+        new_snapshot = _snapshot(directory)
+        if new_snapshot != snapshot:
+            break
+    # editors often write a file in several steps; wait until they're done
+    while True:
+        time.sleep(debounce)
+        settled_snapshot = _snapshot(directory)
+        if settled_snapshot == new_snapshot:
+            break
+        new_snapshot = settled_snapshot
+    changed = {
+        path
+        for path in set(snapshot) | set(new_snapshot)
+        if snapshot.get(path) != new_snapshot.get(path)
+    }
+    return new_snapshot, changed
+
+
 def _fetcher(recipe: str) -> str:
     tokenized_recipe = _tokenize_expression(recipe)
     return tokenized_recipe[tokenized_recipe.index(':fetcher') + 1]
@@ -637,6 +1811,7 @@ def _local_repo() -> str:
 
 def _clone(repo: str, into: str, branch: str, fetcher: str = 'github') -> bool:
     """Try to clone the repository; return whether we succeeded."""
+    global _BYTES_FETCHED
     print(
         f"Checking out {repo}" + (f" ({branch} branch)" if branch else ""),
         file=sys.stderr,
@@ -670,12 +1845,25 @@ def _clone(repo: str, into: str, branch: str, fetcher: str = 'github') -> bool:
         _fail(f"Unrecognized SCM: {scm}")
         return False
     scm_command = [scm, 'clone', *options, repo, into]
-    run_result = subprocess.run(scm_command, stderr=subprocess.PIPE)
-    if run_result.returncode != 0:
-        _fail(f"Unable to clone:\n  {' '.join(scm_command)}")
-        _fail(run_result.stderr.decode())
-        return False
-    return True
+    with _stage('clone'):
+        run_result = _run(scm_command, stderr=subprocess.PIPE)
+        if run_result.returncode != 0:
+            _fail(f"Unable to clone:\n  {' '.join(scm_command)}")
+            _fail(run_result.stderr.decode())
+            return False
+        with _USAGE_LOCK:
+            _BYTES_FETCHED += _tree_size(into)
+        return True
+    return False  # the clone ran out of time
+
+
+def _tree_size(directory: str) -> int:
+    """Return the total size of the files under directory."""
+    return sum(
+        os.lstat(os.path.join(root, file)).st_size
+        for root, _, files in os.walk(directory)
+        for file in files
+    )
 
 
 def _branch(recipe: str) -> str:
@@ -697,7 +1885,7 @@ def check_melpa_pr(pr_url: str):
     match = re.match(MELPA_PR, pr_url)  # MELPA_PR's 0th group has the number
     assert match
 
-    pr_data = requests.get(f"{MELPA_PULL_API}/{match.groups()[0]}").json()
+    pr_data = _get(f"{MELPA_PULL_API}/{match.groups()[0]}").json()
     if 'changed_files' not in pr_data:
         _fail(f"{pr_url} does not appear to be a MELPA PR: {pr_data}")
         return
@@ -711,6 +1899,23 @@ def check_melpa_pr(pr_url: str):
     if filename != package_name(recipe):
         _fail(f"Recipe filename '{filename}' does not match '{package_name(recipe)}'")
         return
+    # start the lookups that only wait on the network now, so that they
+    # overlap the clone and the build; the report reads their (cached) results
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        executor.submit(repo_info_github, _clone_address(recipe))
+        if os.environ.get('EXIST_OK', '').lower() != 'true':
+            executor.submit(_similar_packages, package_name(recipe))
+        _check_melpa_pr_recipe(recipe, pr_data)
+
+
+def _check_melpa_pr_recipe(recipe: str, pr_data: dict):
+    """Check the recipe in a MELPA PR, whose data is PR_DATA."""
+    if os.environ.get('EXIST_OK', '').lower() != 'true':
+        # a new package can't take an existing one's name, so stop early:
+        if package_name(recipe) in _known_packages():
+            _note('### Preflight ###\n', CLR_INFO)
+            _fail(f"- Package '{package_name(recipe)}' already exists!")
+            return
     with tempfile.TemporaryDirectory() as elisp_dir:
         # package-build prefers the directory to be named after the package:
         elisp_dir = os.path.join(elisp_dir, package_name(recipe))
@@ -746,7 +1951,7 @@ def check_melpa_pr(pr_url: str):
 def _filename_and_recipe(pr_data_diff_url: str) -> Tuple[str, str]:
     """Determine the filename and the contents of the user's recipe."""
     # TODO: use https://developer.github.com/v3/repos/contents/ instead of 'patch'
-    diff_text = requests.get(pr_data_diff_url).text
+    diff_text = _get(pr_data_diff_url).text
     if (
         'new file mode' not in diff_text
         or 'a/recipes' not in diff_text
@@ -805,26 +2010,94 @@ def run_build_script(script: str) -> str:
     >>> run_build_script("(require 'package-build) (require 'package-recipe)")
     ''
     """
-    with tempfile.TemporaryDirectory() as tmpdir:
-        for filename, content in _package_build_files().items():
-            with open(os.path.join(tmpdir, filename), 'w') as file:
-                file.write(content)
-        script = f"""(progn (add-to-list 'load-path "{tmpdir}") {script})"""
-        result = subprocess.run(
-            ['emacs', '--batch', '--eval', script],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        if result.returncode != 0:
-            raise ChildProcessError(result.stderr.decode())
-        return str(result.stdout.decode()).strip()
+    script = f"""(progn (add-to-list 'load-path "{_package_build_dir()}") {script})"""
+    dump_file = _emacs_dump_file()
+    emacs = ['emacs', f"--dump-file={dump_file}"] if dump_file else ['emacs']
+    result = _run(
+        [*emacs, '--batch', '--eval', script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        raise ChildProcessError(result.stderr.decode())
+    return str(result.stdout.decode()).strip()
+
+
+@functools.lru_cache()
+def _emacs_dump_file() -> str:
+    """Return a pdumper image of Emacs with package-build preloaded.
+    The image is keyed by the Emacs binary and version and by the
+    package-build sources, so it's rebuilt whenever any of them change.
+    Return the empty string if this Emacs can't dump (e.g. Emacs < 27).
+    """
+    emacs = shutil.which('emacs')
+    if not emacs or os.environ.get('MELPAZOID_NO_DUMP'):
+        return ''
+    version_result = _run(
+        ['emacs', '--batch', '--eval', '(princ emacs-version)'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    version = version_result.stdout.decode().strip()
+    emacs_stat = os.stat(os.path.realpath(emacs))
+    key = f"{os.path.realpath(emacs)}:{emacs_stat.st_mtime_ns}:{emacs_stat.st_size}"
+    key += f":{version}:{_package_build_dir()}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    dump_file = os.path.join(_CACHE_DIR, f"emacs-{version}-{digest}.pdmp")
+    if os.path.isfile(dump_file):
+        _count('melpazoid_cache_requests_total', cache='dump', result='hit')
+        return dump_file
+    _count('melpazoid_cache_requests_total', cache='dump', result='miss')
+    # dump to a scratch file first so that concurrent runs never see a partial image
+    scratch = f"{dump_file}.{os.getpid()}"
+    script = f"""
+    (progn
+      (add-to-list 'load-path "{_package_build_dir()}")
+      (require 'package)
+      (require 'package-build)
+      (require 'package-recipe)
+      (dump-emacs-portable "{scratch}"))
+    """
+    result = _run(
+        ['emacs', '--batch', '--eval', script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0 or not os.path.isfile(scratch):
+        return ''
+    os.replace(scratch, dump_file)
+    return dump_file
+
+
+@functools.lru_cache()
+def _package_build_dir() -> str:
+    """Write package-build's files to a directory keyed by their contents."""
+    files = _package_build_files()
+    digest = hashlib.sha1()
+    for filename in sorted(files):
+        digest.update(files[filename].encode())
+    build_dir = os.path.join(_CACHE_DIR, f"package-build-{digest.hexdigest()[:12]}")
+    if os.path.isdir(build_dir):
+        _count('melpazoid_cache_requests_total', cache='package_build', result='hit')
+        return build_dir
+    _count('melpazoid_cache_requests_total', cache='package_build', result='miss')
+    os.makedirs(_CACHE_DIR, exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=_CACHE_DIR)
+    for filename, content in files.items():
+        with open(os.path.join(scratch, filename), 'w') as file:
+            file.write(content)
+    try:
+        os.rename(scratch, build_dir)
+    except OSError:  # another run got there first
+        shutil.rmtree(scratch, ignore_errors=True)
+    return build_dir
 
 
 @functools.lru_cache()
 def _package_build_files() -> dict:
     """Grab the required package-build files from the MELPA repo."""
     return {
-        filename: requests.get(
+        filename: _get(
             'https://raw.githubusercontent.com/melpa/melpa/master/'
             f'package-build/{filename}'
         ).text
@@ -840,7 +2113,7 @@ def _package_build_files() -> dict:
 @functools.lru_cache()
 def _package_recipe_el() -> str:
     """Grab the source code for MELPA's package-build/package-recipe.el"""
-    return requests.get(
+    return _get(
         'https://raw.githubusercontent.com/melpa/melpa/master/'
         'package-build/package-recipe.el'
     ).text
@@ -850,7 +2123,9 @@ def _check_melpa_pr_loop() -> None:
     """Check MELPA pull requests in a loop."""
     for pr_url in _fetch_pull_requests():
         print(f"Checking {pr_url}")
+        start_time = time.monotonic()
         check_melpa_pr(pr_url)
+        _record_review(pr_url, start_time)
         if _return_code() != 0:
             _fail('<!-- This PR failed -->')
         else:
@@ -903,21 +2178,106 @@ def _argparse_recipe(recipe: str) -> str:
     return recipe
 
 
+def _argparse_directory(directory: str) -> str:
+    if not os.path.isdir(directory):
+        raise argparse.ArgumentTypeError("%r must be a directory" % directory)
+    return os.path.abspath(directory)
+
+
+def _local_recipe(directory: str) -> str:
+    """Make up a recipe for a local package, named after its main file.
+    >>> _local_recipe('/home/me/shx')
+    '(shx :fetcher git :url "/home/me/shx")'
+    """
+    return f'({_local_package_name(directory)} :fetcher git :url "{directory}")'
+
+
+def _local_package_name(directory: str) -> str:
+    """Guess the name of the package in DIRECTORY from its main file.
+    That's its -pkg.el file, or else its shortest-named .el file with a
+    Version or Package-Requires header; failing that, use the directory's name.
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     directory = os.path.join(tmpdir, 'shx-for-emacs')
+    ...     os.mkdir(directory)
+    ...     with open(os.path.join(directory, 'shx.el'), 'w') as file:
+    ...         _ = file.write(';;; shx.el --- Extras\\n;; Version: 1.0\\n')
+    ...     open(os.path.join(directory, 'shx-test.el'), 'w').close()
+    ...     _local_package_name(directory)
+    'shx'
+    """
+    name = os.path.basename(directory)
+    try:
+        filenames = sorted(os.listdir(directory), key=lambda f: (len(f), f))
+    except OSError:
+        return name
+    if f"{name}.el" in filenames:
+        return name
+    pkg_el_files = [f for f in filenames if f.endswith('-pkg.el')]
+    if len(pkg_el_files) == 1:
+        return pkg_el_files[0][: -len('-pkg.el')]
+    for filename in filenames:
+        if not filename.endswith('.el') or filename.startswith('.'):
+            continue
+        with open(os.path.join(directory, filename), errors='replace') as file:
+            header = file.read(4096)
+        if re.search(r'^;+ *(Package-)?(Version|Requires):', header, flags=re.M):
+            return filename[: -len('.el')]
+    return name
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     target_help = 'a MELPA PR URL, or a local path to a recipe or package'
     parser.add_argument('target', help=target_help, nargs='?', type=_argparse_target)
     parser.add_argument('--license', help='only check licenses', action='store_true')
-    parser.add_argument('--recipe', help='a valid MELPA recipe', type=_argparse_recipe)
+    parser.add_argument(
+        '--lint-recipes',
+        help="lint every recipe in a directory (e.g. MELPA's recipes/)",
+        metavar='DIRECTORY',
+        type=_argparse_directory,
+    )
+    parser.add_argument(
+        '--performance',
+        help='also run the (opt-in) performance checks',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--recipe',
+        help='a valid MELPA recipe (can be given more than once)',
+        action='append',
+        type=_argparse_recipe,
+    )
+    parser.add_argument(
+        '--watch',
+        help='re-check a local package whenever its files change',
+        metavar='DIRECTORY',
+        type=_argparse_directory,
+    )
     pargs = parser.parse_args()
+    if pargs.performance:
+        os.environ['MELPAZOID_PERFORMANCE'] = 'true'  # read by melpazoid.el
+    if os.environ.get('MELPAZOID_METRICS_PORT'):
+        _serve_metrics(
+            os.environ.get('MELPAZOID_METRICS_ADDRESS', '127.0.0.1'),
+            int(os.environ['MELPAZOID_METRICS_PORT']),
+        )
+    start_time = time.monotonic()
 
     if pargs.license:
         if not os.environ.get('RECIPE'):
             _fail('Set env var RECIPE or specify a recipe with: [--recipe RECIPE]')
         else:
             check_license(os.environ['RECIPE'])
+    elif pargs.lint_recipes:
+        lint_recipes(pargs.lint_recipes)
+    elif pargs.watch:
+        watch_local_package(
+            os.environ.get('RECIPE') or _local_recipe(pargs.watch), pargs.watch
+        )
     elif 'MELPA_PR_URL' in os.environ:
         check_melpa_pr(os.environ['MELPA_PR_URL'])
+    elif pargs.recipe and len(pargs.recipe) > 1:
+        check_melpa_recipes(pargs.recipe)
     elif 'RECIPE' in os.environ:
         check_melpa_recipe(os.environ['RECIPE'])
     elif 'RECIPE_FILE' in os.environ:
@@ -925,4 +2285,5 @@ if __name__ == '__main__':
             check_melpa_recipe(file.read())
     else:
         _check_melpa_pr_loop()
+    _record_review(pargs.target or os.environ.get('RECIPE', ''), start_time)
     sys.exit(_return_code())
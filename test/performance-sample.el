@@ -0,0 +1,38 @@
+;;; performance-sample.el --- Triggers each performance rule  -*- lexical-binding: t -*-
+
+;;; Commentary:
+
+;; Each form below should be reported by `melpazoid-check-performance';
+;; see test-performance.el.
+
+;;; Code:
+
+(require 'org)
+
+(defun performance-sample-line ()
+  "Return the current line number, slowly."
+  (line-number-at-pos))
+
+(defun performance-sample-text ()
+  "Return the region's text, with its properties."
+  (buffer-substring (point) (mark)))
+
+(defun performance-sample-loop (words)
+  "Loop over WORDS in several slow ways."
+  (let ((result nil))
+    (dolist (word words)
+      (when (> (length words) 1)
+        (setq result (append result (list word)))
+        (setq result (nconc result (list word)))
+        (string-match (regexp-opt words) word)))
+    result))
+
+(defun performance-sample-update ()
+  "Scan the whole buffer after every command."
+  (save-excursion
+    (goto-char (point-min))))
+
+(add-hook 'post-command-hook #'performance-sample-update)
+
+(provide 'performance-sample)
+;;; performance-sample.el ends here
@@ -0,0 +1,45 @@
+;;; test-performance.el --- Check that each performance rule fires  -*- lexical-binding: t -*-
+
+;;; Commentary:
+
+;; Run with: emacs --batch --load test/test-performance.el
+;; Fails if any of `melpazoid-check-performance's rules doesn't report
+;; performance-sample.el, which has one example of each.
+
+;;; Code:
+
+(defconst test-performance-dir (file-name-directory load-file-name))
+
+;; load melpazoid.el without running its (noninteractive) checks:
+(let ((noninteractive nil))
+  (load (expand-file-name "../melpazoid/melpazoid.el" test-performance-dir) nil t))
+
+(defconst test-performance-messages
+  '("`line-number-at-pos` is surprisingly slow"
+    "Prefer `buffer-substring-no-properties`"
+    "`length` is O(n)"
+    "`append` in a loop"
+    "`nconc` in a loop"
+    "Build this regexp once outside the loop"
+    "This library is slow to load"
+    "avoid buffer-wide scans here")
+  "A message from each of the rules in `melpazoid-check-performance'.")
+
+(let ((noninteractive nil)  ; i.e. `melpazoid-insert' into `melpazoid-buffer'
+      (missing nil))
+  (ignore-errors (kill-buffer melpazoid-buffer))
+  (with-current-buffer
+      (find-file-noselect (expand-file-name "performance-sample.el" test-performance-dir))
+    (melpazoid-check-performance))
+  (with-current-buffer (get-buffer-create melpazoid-buffer)
+    (princ (buffer-string))
+    (dolist (message test-performance-messages)
+      (unless (save-excursion
+                (goto-char (point-min))
+                (search-forward message nil t))
+        (push message missing))))
+  (when missing
+    (princ (format "These rules never fired: %S\n" (nreverse missing)))
+    (kill-emacs 1)))
+
+;;; test-performance.el ends here